@@ -0,0 +1,67 @@
+"""Startup budget check for the pipeline CLI.
+
+Runs ``python -X importtime -c "import pipeline"`` in a fresh interpreter and
+fails when the cumulative import time exceeds the budget or when heavy modules
+that should stay lazy (scikit-learn, SciPy) are pulled in at import time.
+"""
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+BASE_DIR = Path(__file__).resolve().parent
+DEFAULT_BUDGET_MS = 1000.0
+LAZY_MODULES = ("sklearn", "scipy")
+
+
+def measure_imports(module: str = "pipeline") -> Dict[str, float]:
+    """Return the cumulative import time (ms) of every module loaded by ``module``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        timings[name.strip()] = int(cumulative) / 1000
+    return timings
+
+
+def check_startup(module: str = "pipeline", budget_ms: float = DEFAULT_BUDGET_MS) -> List[str]:
+    timings = measure_imports(module)
+    problems: List[str] = []
+    total = timings.get(module, 0.0)
+    print(f"⏱️ import {module}: {total:.0f} ms (orçamento {budget_ms:.0f} ms)")
+    if total > budget_ms:
+        problems.append(f"import {module} levou {total:.0f} ms, acima do orçamento de {budget_ms:.0f} ms")
+    for name in timings:
+        if name.split(".")[0] in LAZY_MODULES:
+            problems.append(f"módulo pesado importado na inicialização: {name}")
+            break
+    return problems
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Verifica o tempo de inicialização do pipeline via -X importtime.")
+    parser.add_argument("--module", default="pipeline", help="Módulo a ser importado.")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS, help="Tempo máximo de import em ms.")
+    args = parser.parse_args(argv)
+
+    problems = check_startup(args.module, args.budget_ms)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ Inicialização dentro do orçamento")
+
+
+if __name__ == "__main__":
+    main()
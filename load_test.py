@@ -0,0 +1,90 @@
+"""Concurrent-session load test for the Streamlit dashboard.
+
+Simulates N sessions with ``streamlit.testing.v1.AppTest`` running in threads of
+one process, which is how the Streamlit server shares ``st.cache_resource``
+between sessions, and reports resident memory and rerun latency. Run
+``python pipeline.py`` first so the artifacts exist.
+"""
+from __future__ import annotations
+
+import argparse
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Sequence
+
+from streamlit.testing.v1 import AppTest
+
+BASE_DIR = Path(__file__).resolve().parent
+APP_PATH = BASE_DIR / "streamlit_app.py"
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB (peak RSS where /proc is unavailable)."""
+    status = Path("/proc/self/status")
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_session(app: Path, reruns: int, timeout: float) -> List[float]:
+    """Open one session and rerun it, paging through the record sample each time."""
+    session = AppTest.from_file(str(app), default_timeout=timeout)
+    latencies: List[float] = []
+    for attempt in range(reruns):
+        if attempt:
+            page = [widget for widget in session.number_input if widget.label == "Página"][0]
+            page.set_value(min(attempt + 1, int(page.proto.max)))
+        start = time.perf_counter()
+        session.run()
+        latencies.append(time.perf_counter() - start)
+        if session.exception:
+            raise RuntimeError(session.exception[0].value)
+    return latencies
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Simula sessões simultâneas do painel e mede RSS e latência.")
+    parser.add_argument("--sessions", type=int, default=8, help="Número de sessões simultâneas.")
+    parser.add_argument("--reruns", type=int, default=5, help="Reruns por sessão (o primeiro é a abertura).")
+    parser.add_argument("--app", type=Path, default=APP_PATH, help="Script Streamlit a ser testado.")
+    parser.add_argument("--timeout", type=float, default=120, help="Tempo máximo por rerun, em segundos.")
+    args = parser.parse_args(argv)
+
+    # A warm-up session pays for imports and the shared dataset load, so the
+    # numbers below reflect what each additional session costs.
+    warmup = run_session(args.app, 1, args.timeout)[0]
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        futures = [pool.submit(run_session, args.app, args.reruns, args.timeout) for _ in range(args.sessions)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    rss_after = rss_mb()
+
+    first_runs = [latencies[0] for latencies in results]
+    reruns = [value for latencies in results for value in latencies[1:]]
+    print(f"Aquecimento (imports + carga compartilhada): {warmup * 1000:.0f} ms")
+    print(f"Sessões: {args.sessions} · reruns por sessão: {args.reruns} · tempo total: {elapsed:.1f}s")
+    print(f"RSS: {rss_before:.0f} MiB → {rss_after:.0f} MiB (+{(rss_after - rss_before) / args.sessions:.1f} MiB por sessão)")
+    print(f"Abertura: mediana {statistics.median(first_runs) * 1000:.0f} ms · máx {max(first_runs) * 1000:.0f} ms")
+    if reruns:
+        print(
+            f"Rerun: p50 {percentile(reruns, 50) * 1000:.0f} ms · p95 {percentile(reruns, 95) * 1000:.0f} ms"
+            f" · máx {max(reruns) * 1000:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,21 +4,58 @@ The script replicates the notebook workflow with clearer structure so it can be
 executed headlessly. It loads the Excel workbook, reshapes class metrics into a
 long format, cleans and scores engagement metrics, and finally performs
 clustering with deterministic IDs built from student + room + unit.
+
+Run ``python pipeline.py --help`` for the command-line options; scikit-learn is
+only imported when the clustering stage actually runs.
 """
 from __future__ import annotations
 
+import argparse
+import hashlib
+import io
+import json
+import os
 import re
+import shutil
+import stat
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Sequence, Set, Tuple
+from urllib.parse import quote
 
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import StandardScaler
 
-RAW_WORKBOOK = Path("Base anonimizada - Eric - PUC-SP.xlsx")
+BASE_DIR = Path(__file__).resolve().parent
+RAW_WORKBOOK = BASE_DIR / "Base anonimizada - Eric - PUC-SP.xlsx"
+STAGES = ("clean", "score", "cluster", "diff", "charts", "history", "report")
+# The static HTML reports are opt-in (``--stages ...,report``).
+DEFAULT_STAGES = tuple(stage for stage in STAGES if stage != "report")
+REPORTS_DIR_NAME = "reports"
+MANIFEST_NAME = "artifacts_manifest.json"
+HISTORY_DIR_NAME = "history"
+HISTORY_DATASETS = ("cleaned", "scores")
+HISTORY_PARTITIONS = ["term", "Unidade"]
+HIVE_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+HISTORY_MARKER = "_updated.json"
+DIFF_THRESHOLD = 0.1
+DIFF_COLUMNS = ["tipo", "aluno_id", "Aula", "antes", "depois", "delta"]
+COMPRESSION_SUFFIXES = {None: "", "gzip": ".gz", "zstd": ".zst"}
+HASH_PREFIX_LENGTH = 8
+# Artifacts each artifact is derived from; rewriting one invalidates everything downstream.
+ARTIFACT_DEPENDENCIES = {
+    "scores": ("cleaned",),
+    "clusters": ("scores",),
+    "cluster_profiles": ("scores",),
+    "rankings": ("clusters",),
+    "diff": ("scores", "clusters"),
+    "charts": ("scores", "clusters"),
+}
 CLASS_METRICS = ["Pre-Class", "P", "Hw", "CP", "Bh"]
 ID_COLUMNS = ["Nome Planilha Feedback", "Sala", "Num", "NOME COMPLETO"]
 
@@ -45,6 +82,9 @@ MONTH_MAP = {
     "dez.": "Dec",
 }
 
+RANKING_SIZE = 10
+RANKING_COLUMNS = ["aluno_id", "Aluno", "Sala", "Unidade", "cluster", "engajamento"]
+
 
 @dataclass(frozen=True)
 class PipelineArtifacts:
@@ -52,6 +92,35 @@ class PipelineArtifacts:
     scores: Path
     clusters: Path
     cluster_profiles: Path
+    rankings: Path
+    charts: Path
+    diff: Path
+    manifest: Path
+
+    @classmethod
+    def in_dir(cls, output_dir: Path, compression: str | None = None) -> "PipelineArtifacts":
+        suffix = COMPRESSION_SUFFIXES[compression]
+        return cls(
+            cleaned=output_dir / f"cleaned_records.csv{suffix}",
+            scores=output_dir / f"engagement_scores.csv{suffix}",
+            clusters=output_dir / f"student_clusters.csv{suffix}",
+            cluster_profiles=output_dir / f"cluster_profiles.csv{suffix}",
+            rankings=output_dir / f"student_rankings.csv{suffix}",
+            charts=output_dir / "chart_data.json",
+            diff=output_dir / f"run_diff.csv{suffix}",
+            manifest=output_dir / MANIFEST_NAME,
+        )
+
+    @classmethod
+    def from_manifest(cls, output_dir: Path) -> "PipelineArtifacts":
+        """Resolve the content-hashed files currently published by the manifest."""
+        templates = cls.in_dir(output_dir)
+        entries = load_manifest(output_dir)["artifacts"]
+        resolved = {
+            name: output_dir / entries[name]["path"] if name in entries else getattr(templates, name)
+            for name in cls.__dataclass_fields__
+        }
+        return cls(**resolved)
 
 
 def parse_pt_br_date(value) -> pd.Timestamp:
@@ -252,7 +321,14 @@ def calculate_scores(clean_df: pd.DataFrame) -> pd.DataFrame:
     return scores
 
 
-def run_clustering(scores: pd.DataFrame, n_clusters: int = 4) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def run_clustering(
+    scores: pd.DataFrame, n_clusters: int = 4, jobs: int | None = None
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    # Imported lazily so clean/score-only runs do not pay for scikit-learn.
+    from sklearn.cluster import KMeans
+    from sklearn.preprocessing import StandardScaler
+    from threadpoolctl import threadpool_limits
+
     metrics = ["prep_score", "attendance_score", "homework_score", "interaction_score", "engajamento"]
     grouped = scores.groupby(["aluno_id", "Aluno", "Sala", "Unidade"])[metrics].mean().reset_index()
 
@@ -267,43 +343,745 @@ def run_clustering(scores: pd.DataFrame, n_clusters: int = 4) -> Tuple[pd.DataFr
     features = scaler.fit_transform(grouped[metrics])
 
     kmeans = KMeans(n_clusters=target_clusters, n_init=10, random_state=42)
-    grouped["cluster"] = kmeans.fit_predict(features)
+    with threadpool_limits(limits=jobs) if jobs else nullcontext():
+        grouped["cluster"] = kmeans.fit_predict(features)
 
     cluster_profile = grouped.groupby("cluster")[metrics].mean().reset_index()
     return grouped, cluster_profile
 
 
-def run_pipeline(raw_path: Path = RAW_WORKBOOK) -> PipelineArtifacts:
-    if not raw_path.exists():
-        raise FileNotFoundError(f"Arquivo não encontrado: {raw_path}")
+def align_clusters(
+    clusters: pd.DataFrame, profiles: pd.DataFrame, previous_profiles: pd.DataFrame
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Relabel clusters so each one keeps the id of the nearest previous profile.
+
+    KMeans ids are arbitrary, so a rerun on slightly different data can swap
+    them. Profiles are matched one-to-one by the Hungarian algorithm on the
+    Euclidean distance between centroids; clusters left without a previous
+    match get the smallest ids not taken.
+    """
+    # SciPy ships with scikit-learn but is kept out of the import-time path.
+    from scipy.optimize import linear_sum_assignment
+
+    metrics = [column for column in profiles.columns if column != "cluster" and column in previous_profiles.columns]
+    if previous_profiles.empty or not metrics:
+        return clusters, profiles
+
+    current = profiles[metrics].to_numpy(dtype=float)
+    previous = previous_profiles[metrics].to_numpy(dtype=float)
+    distances = np.linalg.norm(current[:, None, :] - previous[None, :, :], axis=2)
+    rows, cols = linear_sum_assignment(distances)
+
+    mapping = dict(zip(profiles["cluster"].to_numpy()[rows], previous_profiles["cluster"].to_numpy()[cols]))
+    free = (label for label in range(len(profiles) + len(previous_profiles)) if label not in mapping.values())
+    for label in profiles["cluster"]:
+        if label not in mapping:
+            mapping[label] = next(free)
+    mapping = {int(label): int(target) for label, target in mapping.items()}
+
+    aligned_profiles = profiles.assign(cluster=profiles["cluster"].map(mapping)).sort_values("cluster", ignore_index=True)
+    return clusters.assign(cluster=clusters["cluster"].map(mapping)), aligned_profiles
+
+
+def top_k(df: pd.DataFrame, k: int, column: str = "engajamento", largest: bool = True) -> pd.DataFrame:
+    """Select the ``k`` highest (or lowest) rows without sorting the whole frame."""
+    if largest:
+        return df.nlargest(k, column)
+    return df.nsmallest(k, column)
+
+
+def build_rankings(clusters_df: pd.DataFrame, k: int = RANKING_SIZE) -> pd.DataFrame:
+    """Precompute top/bottom ``k`` students per cluster and per unidade.
+
+    Student averages in ``student_clusters.csv`` already match the per-student
+    mean of ``engajamento`` used by the dashboard, so the rankings are built
+    straight from the clustering output with partial selection.
+    """
+    frames: List[pd.DataFrame] = []
+    for escopo, column in (("cluster", "cluster"), ("unidade", "Unidade")):
+        for chave, group in clusters_df.groupby(column, sort=True):
+            for ordem, largest in (("top", True), ("bottom", False)):
+                ranked = top_k(group, k, largest=largest)[RANKING_COLUMNS].reset_index(drop=True)
+                ranked.insert(0, "posicao", np.arange(1, len(ranked) + 1))
+                ranked.insert(0, "ordem", ordem)
+                ranked.insert(0, "chave", str(chave))
+                ranked.insert(0, "escopo", escopo)
+                frames.append(ranked)
+
+    if not frames:
+        return pd.DataFrame(columns=["escopo", "chave", "ordem", "posicao"] + RANKING_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def engagement_by_aula(scores: pd.DataFrame) -> pd.DataFrame:
+    return scores.groupby("Aula", sort=True)["engajamento"].mean().reset_index()
+
+
+def engagement_heatmap(scores: pd.DataFrame, by: str = "Unidade") -> pd.DataFrame:
+    return scores.groupby([by, "Aula"], sort=True)["engajamento"].mean().reset_index()
+
+
+def cluster_counts(clusters: pd.DataFrame) -> pd.DataFrame:
+    return clusters.groupby("cluster", sort=True)["aluno_id"].nunique().rename("alunos").reset_index()
+
+
+def cluster_unit_breakdown(clusters: pd.DataFrame) -> pd.DataFrame:
+    return clusters.groupby(["cluster", "Unidade"], sort=True)["aluno_id"].nunique().rename("alunos").reset_index()
+
+
+def chart_specs() -> Dict[str, Dict[str, object]]:
+    """Vega-Lite specs (without data) for the charts of the presentation tab."""
+    return {
+        "engagement_by_aula": {
+            "mark": {"type": "line", "point": True},
+            "encoding": {
+                "x": {"field": "Aula", "type": "ordinal", "title": "Aula"},
+                "y": {"field": "engajamento", "type": "quantitative", "title": "Engajamento"},
+                "tooltip": [
+                    {"field": "Aula", "type": "ordinal"},
+                    {"field": "engajamento", "type": "quantitative", "format": ".2f"},
+                ],
+            },
+        },
+        "heatmap": {
+            "mark": "rect",
+            "encoding": {
+                "x": {"field": "Aula", "type": "ordinal", "title": "Aula"},
+                "y": {"field": "Unidade", "type": "nominal", "sort": "ascending"},
+                "color": {
+                    "field": "engajamento",
+                    "type": "quantitative",
+                    "scale": {"scheme": "redyellowgreen"},
+                    "title": "Engajamento",
+                },
+                "tooltip": [
+                    {"field": "Unidade", "type": "nominal"},
+                    {"field": "Aula", "type": "ordinal"},
+                    {"field": "engajamento", "type": "quantitative", "format": ".2f"},
+                ],
+            },
+            "height": 300,
+        },
+        "cluster_counts": {
+            "mark": "bar",
+            "encoding": {
+                "x": {"field": "cluster", "type": "ordinal", "title": "Cluster"},
+                "y": {"field": "alunos", "type": "quantitative", "title": "Alunos"},
+                "tooltip": [{"field": "cluster", "type": "ordinal"}, {"field": "alunos", "type": "quantitative"}],
+            },
+        },
+    }
+
+
+def frame_records(df: pd.DataFrame) -> List[Dict[str, object]]:
+    return json.loads(df.to_json(orient="records"))
+
+
+def build_chart_payload(scores: pd.DataFrame, clusters: pd.DataFrame) -> Dict[str, object]:
+    """Bundle the chart series the dashboard would otherwise rebuild on every render.
+
+    The Unidade×Aula heatmap doubles as the per-unit trend and the
+    cluster×Unidade breakdown as the per-unit cluster distribution, so
+    whole-unit filters are served from the bundle as well.
+    """
+    return {
+        "series": {
+            "engagement_by_aula": frame_records(engagement_by_aula(scores)),
+            "heatmap": frame_records(engagement_heatmap(scores)),
+            "cluster_counts": frame_records(cluster_counts(clusters)),
+            "cluster_unit_breakdown": frame_records(cluster_unit_breakdown(clusters)),
+        },
+        "specs": chart_specs(),
+    }
+
+
+def diff_runs(
+    previous_scores: pd.DataFrame,
+    scores: pd.DataFrame,
+    previous_clusters: pd.DataFrame,
+    clusters: pd.DataFrame,
+    threshold: float = DIFF_THRESHOLD,
+) -> pd.DataFrame:
+    """Compare two runs and return one row per change.
+
+    Students are hash-joined on ``aluno_id`` (new/removed students and cluster
+    moves) and lessons on ``aluno_id`` + ``Aula`` (engagement deltas of at least
+    ``threshold`` and changed ``acao_recomendada``). Everything is expressed as
+    merges and boolean masks, so the cost stays linear in the number of rows.
+    Cluster ids are compared as-is, so ``clusters`` should already be aligned
+    with the previous run (see ``align_clusters``).
+    """
+    students = previous_clusters[["aluno_id", "cluster"]].merge(
+        clusters[["aluno_id", "cluster"]], on="aluno_id", how="outer", suffixes=("_antes", "_depois"), indicator=True
+    )
+    # The outer merge upcasts ids to float to hold NaN for unmatched students.
+    students = students.astype({"cluster_antes": "Int64", "cluster_depois": "Int64"})
+    lessons = previous_scores[["aluno_id", "Aula", "engajamento", "acao_recomendada"]].merge(
+        scores[["aluno_id", "Aula", "engajamento", "acao_recomendada"]],
+        on=["aluno_id", "Aula"],
+        how="inner",
+        suffixes=("_antes", "_depois"),
+    )
+    delta = lessons["engajamento_depois"] - lessons["engajamento_antes"]
+
+    def changes(tipo: str, frame: pd.DataFrame, antes, depois, delta=np.nan, aula=pd.NA) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "tipo": tipo,
+                "aluno_id": frame["aluno_id"].to_numpy(),
+                "Aula": aula,
+                "antes": antes,
+                "depois": depois,
+                "delta": delta,
+            },
+            index=pd.RangeIndex(len(frame)),
+        )
+
+    added = students[students["_merge"] == "right_only"]
+    removed = students[students["_merge"] == "left_only"]
+    kept = students[students["_merge"] == "both"]
+    moved = kept[kept["cluster_antes"] != kept["cluster_depois"]]
+    shifted = lessons[delta.abs() >= threshold]
+    new_action = lessons[lessons["acao_recomendada_antes"] != lessons["acao_recomendada_depois"]]
+
+    frames = [
+        changes("aluno_novo", added, pd.NA, added["cluster_depois"].to_numpy()),
+        changes("aluno_removido", removed, removed["cluster_antes"].to_numpy(), pd.NA),
+        changes("mudanca_cluster", moved, moved["cluster_antes"].to_numpy(), moved["cluster_depois"].to_numpy()),
+        changes(
+            "variacao_engajamento",
+            shifted,
+            shifted["engajamento_antes"].to_numpy(),
+            shifted["engajamento_depois"].to_numpy(),
+            delta[shifted.index].to_numpy(),
+            shifted["Aula"].to_numpy(),
+        ),
+        changes(
+            "mudanca_acao",
+            new_action,
+            new_action["acao_recomendada_antes"].to_numpy(),
+            new_action["acao_recomendada_depois"].to_numpy(),
+            aula=new_action["Aula"].to_numpy(),
+        ),
+    ]
+    diff = pd.concat([frame.astype({"antes": object, "depois": object}) for frame in frames], ignore_index=True)
+    diff["Aula"] = diff["Aula"].astype("Int64")
+    return diff[DIFF_COLUMNS]
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_file_mode() -> int:
+    """Mode a plain ``open()`` would give a new file under the current umask."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+DEFAULT_FILE_MODE = default_file_mode()
+
+
+def write_temp_file(path: Path, write) -> Path:
+    """Call ``write(tmp_path)`` on a fsynced sibling temp file of ``path`` and return it."""
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        write(tmp_path)
+        # mkstemp creates 0600 files; keep the replaced file's mode, or the umask default.
+        mode = stat.S_IMODE(path.stat().st_mode) if path.exists() else DEFAULT_FILE_MODE
+        tmp_path.chmod(mode)
+        with tmp_path.open("rb+") as handle:
+            os.fsync(handle.fileno())
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return tmp_path
+
+
+def atomic_write(path: Path, write) -> None:
+    """Write ``path`` through a temp file and rename it into place.
+
+    Readers either see the previous complete file or the new complete file,
+    never a partially written one.
+    """
+    tmp_path = write_temp_file(path, write)
+    try:
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
 
-    print("▶️ Carregando dados brutos...")
-    raw_df = pd.read_excel(raw_path, skiprows=2)
-    date_lookup = build_class_date_lookup(raw_path)
 
-    print("▶️ Reestruturando aulas...")
-    long_df = reshape_classes(raw_df, date_lookup)
+def hashed_name(template: Path, digest: str) -> Path:
+    """``engagement_scores.csv.gz`` → ``engagement_scores.<sha8>.csv.gz``."""
+    stem, _, extension = template.name.partition(".")
+    return template.with_name(f"{stem}.{digest[:HASH_PREFIX_LENGTH]}.{extension}")
 
-    print("▶️ Limpando e padronizando valores...")
-    clean_df = clean_dataset(long_df)
-    clean_path = Path("cleaned_records.csv")
-    clean_df.to_csv(clean_path, index=False)
 
-    print("▶️ Calculando scores...")
-    scores_df = calculate_scores(clean_df)
-    scores_path = Path("engagement_scores.csv")
-    scores_df.to_csv(scores_path, index=False)
+def write_hashed_file(template: Path, write) -> Tuple[Path, str]:
+    """Write through a temp file and publish it under a content-hashed name.
+
+    Files are never renamed over a path an existing manifest points to (an
+    equal name means equal bytes), so the manifest stays the only commit point.
+    """
+    tmp_path = write_temp_file(template, write)
+    try:
+        digest = file_sha256(tmp_path)
+        path = hashed_name(template, digest)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return path, digest
+
+
+def write_csv_artifact(df: pd.DataFrame, template: Path, compression: str | None = None) -> Dict[str, object]:
+    path, digest = write_hashed_file(template, lambda tmp: df.to_csv(tmp, index=False, compression=compression))
+    return {"path": path.name, "rows": len(df), "sha256": digest, "compression": compression}
+
+
+def write_json_artifact(payload: Dict[str, object], template: Path) -> Dict[str, object]:
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    path, digest = write_hashed_file(template, lambda tmp: tmp.write_bytes(data))
+    return {"path": path.name, "rows": None, "sha256": digest, "compression": None}
+
+
+def prune_artifacts(output_dir: Path, entries: Dict[str, Dict[str, object]]) -> None:
+    """Delete content-hashed artifacts the published manifest no longer references.
+
+    Also removes leftovers of runs that failed before publishing their manifest.
+    """
+    referenced = {str(entry["path"]) for entry in entries.values()}
+    templates = vars(PipelineArtifacts.in_dir(output_dir))
+    stems = {template.name.partition(".")[0] for name, template in templates.items() if name != "manifest"}
+    pattern = re.compile(rf"^({'|'.join(map(re.escape, stems))})\.[0-9a-f]{{{HASH_PREFIX_LENGTH}}}\.")
+    for path in output_dir.iterdir():
+        if pattern.match(path.name) and path.name not in referenced:
+            path.unlink(missing_ok=True)
+
+
+def load_manifest(output_dir: Path) -> Dict[str, object]:
+    path = output_dir / MANIFEST_NAME
+    if not path.exists():
+        return {"artifacts": {}}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def downstream_artifacts(names: Sequence[str]) -> Set[str]:
+    """Every artifact derived, directly or transitively, from ``names``."""
+    found: Set[str] = set()
+    pending = set(names)
+    while pending:
+        children = {child for child, parents in ARTIFACT_DEPENDENCIES.items() if pending & set(parents)}
+        pending = children - found
+        found |= children
+    return found
+
+
+def write_artifacts(
+    frames: Dict[str, Tuple[pd.DataFrame | Dict[str, object], Path]],
+    output_dir: Path,
+    compression: str | None = None,
+    jobs: int | None = None,
+) -> Path:
+    """Write independent artifacts concurrently, then publish the manifest last.
+
+    DataFrames become (optionally compressed) CSVs and dicts become JSON, each
+    under a new content-hashed name, so the files of the published set are
+    never touched while a run is in progress. Replacing the manifest is the
+    single commit point; superseded files are deleted only afterwards.
+
+    The manifest keeps entries of artifacts not rewritten in this run unless
+    they derive from one that was, so a partial ``--stages`` run never pairs
+    new scores with clusters or charts computed from older data. Without
+    frames nothing is published, so readers keyed on the manifest do not
+    reload.
+    """
+    manifest_path = output_dir / MANIFEST_NAME
+    if not frames:
+        return manifest_path
 
-    print("▶️ Executando clustering...")
-    clusters_df, profile_df = run_clustering(scores_df)
-    clusters_path = Path("student_clusters.csv")
-    profiles_path = Path("cluster_profiles.csv")
-    clusters_df.to_csv(clusters_path, index=False)
-    profile_df.to_csv(profiles_path, index=False)
+    stale = downstream_artifacts(list(frames)) - set(frames)
+    entries = {name: entry for name, entry in load_manifest(output_dir)["artifacts"].items() if name not in stale}
+    workers = min(len(frames), jobs or os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            name: (
+                pool.submit(write_csv_artifact, obj, path, compression)
+                if isinstance(obj, pd.DataFrame)
+                else pool.submit(write_json_artifact, obj, path)
+            )
+            for name, (obj, path) in frames.items()
+        }
+        for name, future in futures.items():
+            entries[name] = future.result()
+
+    payload = {"generated_at": datetime.now().isoformat(timespec="seconds"), "artifacts": entries}
+    atomic_write(
+        manifest_path,
+        lambda tmp: tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"),
+    )
+    prune_artifacts(output_dir, entries)
+    return manifest_path
+
+
+def read_verified_bytes(output_dir: Path, entry: Dict[str, object]) -> bytes:
+    """Read an artifact listed in the manifest, rejecting it if its hash does not match.
+
+    Callers parse the returned buffer itself, so a file replaced between the
+    check and the parse cannot slip through.
+    """
+    data = (output_dir / str(entry["path"])).read_bytes()
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise ValueError(f"Artefato {entry['path']} não confere com o manifesto")
+    return data
+
+
+def read_verified_artifact(output_dir: Path, entry: Dict[str, object], **read_kwargs) -> pd.DataFrame:
+    data = read_verified_bytes(output_dir, entry)
+    return pd.read_csv(io.BytesIO(data), compression=entry.get("compression"), **read_kwargs)
+
+
+def read_verified_json(output_dir: Path, entry: Dict[str, object]) -> Dict[str, object]:
+    return json.loads(read_verified_bytes(output_dir, entry).decode("utf-8"))
+
+
+def read_artifact(output_dir: Path, name: str, stage: str, parse_dates: List[str] | None = None) -> pd.DataFrame:
+    """Load an artifact produced by an earlier run when its stage is skipped."""
+    entry = load_manifest(output_dir)["artifacts"].get(name)
+    path = output_dir / entry["path"] if entry else getattr(PipelineArtifacts.in_dir(output_dir), name)
+    if not path.exists():
+        raise FileNotFoundError(f"Arquivo não encontrado: {path}. Execute a etapa '{stage}' antes.")
+    compression = entry.get("compression") if entry else "infer"
+    return pd.read_csv(path, parse_dates=parse_dates, compression=compression, float_precision="round_trip")
+
+
+def infer_term(df: pd.DataFrame) -> str:
+    """Derive the academic term (``AAAA-S``) from the earliest class date."""
+    first_date = pd.to_datetime(df["Data"], errors="coerce").min()
+    if pd.isna(first_date):
+        return "sem-periodo"
+    return f"{first_date.year}-{1 if first_date.month <= 6 else 2}"
+
+
+def history_partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    # Explicit string types keep terms like "2025-1" from being inferred as ints.
+    schema = pa.schema([(column, pa.string()) for column in HISTORY_PARTITIONS])
+    return ds.partitioning(schema, flavor="hive")
+
+
+def hive_segment(column: str, value) -> str:
+    return f"{column}={HIVE_NULL_PARTITION if pd.isna(value) else quote(str(value), safe='')}"
+
+
+def append_history(history_dir: Path, dataset: str, df: pd.DataFrame, term: str) -> Path:
+    """Store one run in the Hive-style ``term=/Unidade=`` Parquet dataset.
+
+    The whole ``term=`` directory is built in a hidden sibling (ignored by
+    readers) and swapped in with renames, so re-running a term replaces every
+    unit of that term, including units missing from the new data, and readers
+    never see a half-written partition. Partitions are written synchronously
+    with ``pq.write_table``: the dataset writer leaves Arrow I/O tasks behind
+    that can abort the interpreter when this is the last step of a run.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    target = history_dir / dataset
+    target.mkdir(parents=True, exist_ok=True)
+    term_dir = target / hive_segment("term", term)
+    staging = target / f".{term_dir.name}.{uuid.uuid4().hex}.tmp"
+    retired = staging.with_suffix(".old")
+    staging.mkdir()
+    try:
+        for unidade, part in df.groupby("Unidade", sort=False, dropna=False):
+            unit_dir = staging / hive_segment("Unidade", unidade)
+            unit_dir.mkdir()
+            table = pa.Table.from_pandas(part.drop(columns="Unidade"), preserve_index=False)
+            pq.write_table(table, unit_dir / "part-0.parquet")
+        if term_dir.exists():
+            os.replace(term_dir, retired)
+        os.replace(staging, term_dir)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    shutil.rmtree(retired, ignore_errors=True)
+    return target
+
+
+def mark_history_updated(history_dir: Path, term: str) -> Path:
+    """Write the marker readers key their caches on, after every dataset of the run."""
+    marker = history_dir / HISTORY_MARKER
+    payload = {"updated_at": datetime.now().isoformat(timespec="seconds"), "term": term}
+    atomic_write(marker, lambda tmp: tmp.write_text(json.dumps(payload), encoding="utf-8"))
+    return marker
+
+
+def list_history_partitions(history_dir: Path, dataset: str = "scores") -> pd.DataFrame:
+    """List stored ``(term, Unidade)`` partitions from directory names alone."""
+    from urllib.parse import unquote
+
+    rows = []
+    root = history_dir / dataset
+    if root.exists():
+        for term_dir in sorted(root.glob("term=*")):
+            for unit_dir in sorted(term_dir.glob("Unidade=*")):
+                rows.append(
+                    {
+                        "term": unquote(term_dir.name.split("=", 1)[1]),
+                        "Unidade": unquote(unit_dir.name.split("=", 1)[1]),
+                    }
+                )
+    return pd.DataFrame(rows, columns=HISTORY_PARTITIONS)
+
+
+def read_history(
+    history_dir: Path,
+    dataset: str = "scores",
+    columns: List[str] | None = None,
+    terms: Sequence[str] | None = None,
+    unidades: Sequence[str] | None = None,
+    salas: Sequence[str] | None = None,
+) -> pd.DataFrame:
+    """Read only the requested columns from the partitions matching ``terms``/``unidades``.
+
+    ``salas`` is not a partition key; its predicate is pushed down to the
+    Parquet scan instead of filtering the loaded frame.
+    """
+    import pyarrow.dataset as ds
+
+    target = history_dir / dataset
+    if not target.exists():
+        return pd.DataFrame(columns=columns)
+
+    history = ds.dataset(target, format="parquet", partitioning=history_partitioning())
+    predicate = None
+    for column, values in (("term", terms), ("Unidade", unidades), ("Sala", salas)):
+        if values:
+            clause = ds.field(column).isin(list(values))
+            predicate = clause if predicate is None else predicate & clause
+    return history.to_table(columns=columns, filter=predicate).to_pandas()
+
+
+def run_pipeline(
+    raw_path: Path = RAW_WORKBOOK,
+    output_dir: Path = BASE_DIR,
+    stages: Sequence[str] = DEFAULT_STAGES,
+    n_clusters: int = 4,
+    jobs: int | None = None,
+    compression: str | None = None,
+    term: str | None = None,
+    diff_threshold: float = DIFF_THRESHOLD,
+    previous_dir: Path | None = None,
+) -> PipelineArtifacts:
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise ValueError(f"Etapas desconhecidas: {', '.join(sorted(unknown))}")
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    artifacts = PipelineArtifacts.in_dir(output_dir, compression)
+    outputs: Dict[str, pd.DataFrame | Dict[str, object]] = {}
+    clean_df = scores_df = clusters_df = profile_df = rankings_df = None
+
+    if "clean" in stages:
+        if not raw_path.exists():
+            raise FileNotFoundError(f"Arquivo não encontrado: {raw_path}")
+
+        print("▶️ Carregando dados brutos...")
+        raw_df = pd.read_excel(raw_path, skiprows=2)
+        date_lookup = build_class_date_lookup(raw_path)
+
+        print("▶️ Reestruturando aulas...")
+        long_df = reshape_classes(raw_df, date_lookup)
+
+        print("▶️ Limpando e padronizando valores...")
+        clean_df = clean_dataset(long_df)
+        outputs["cleaned"] = clean_df
+
+    if "score" in stages:
+        if clean_df is None:
+            clean_df = read_artifact(output_dir, "cleaned", "clean", parse_dates=["Data"])
+
+        print("▶️ Calculando scores...")
+        scores_df = calculate_scores(clean_df)
+        outputs["scores"] = scores_df
+
+    if "cluster" in stages:
+        if scores_df is None:
+            scores_df = read_artifact(output_dir, "scores", "score", parse_dates=["Data"])
+
+        print("▶️ Executando clustering...")
+        clusters_df, profile_df = run_clustering(scores_df, n_clusters=n_clusters, jobs=jobs)
+
+        # Keep cluster ids stable across runs so the diff, the rankings and
+        # the dashboard notes compare like with like.
+        baseline_dir = previous_dir or output_dir
+        if "cluster_profiles" in load_manifest(baseline_dir)["artifacts"]:
+            previous_profiles = read_artifact(baseline_dir, "cluster_profiles", "cluster")
+            clusters_df, profile_df = align_clusters(clusters_df, profile_df, previous_profiles)
+        outputs["clusters"] = clusters_df
+        outputs["cluster_profiles"] = profile_df
+
+        print("▶️ Pré-calculando rankings...")
+        rankings_df = build_rankings(clusters_df)
+        outputs["rankings"] = rankings_df
+
+    if "diff" in stages:
+        if scores_df is None:
+            scores_df = read_artifact(output_dir, "scores", "score", parse_dates=["Data"])
+        if clusters_df is None:
+            clusters_df = read_artifact(output_dir, "clusters", "cluster")
+
+        # Artifacts are only replaced at the end of the run, so the output
+        # directory still holds the previous run at this point.
+        baseline_dir = previous_dir or output_dir
+        previous = load_manifest(baseline_dir)["artifacts"]
+        if "scores" in previous and "clusters" in previous:
+            previous_scores = read_artifact(baseline_dir, "scores", "score")
+            previous_clusters = read_artifact(baseline_dir, "clusters", "cluster")
+        else:
+            previous_scores, previous_clusters = scores_df.iloc[:0], clusters_df.iloc[:0]
+
+        print("▶️ Comparando com a execução anterior...")
+        diff_df = diff_runs(previous_scores, scores_df, previous_clusters, clusters_df, threshold=diff_threshold)
+        outputs["diff"] = diff_df
+        summary = diff_df["tipo"].value_counts()
+        print("   " + (", ".join(f"{tipo}: {count}" for tipo, count in summary.items()) or "sem mudanças"))
+
+    if "charts" in stages:
+        if scores_df is None:
+            scores_df = read_artifact(output_dir, "scores", "score", parse_dates=["Data"])
+        if clusters_df is None:
+            clusters_df = read_artifact(output_dir, "clusters", "cluster")
+
+        print("▶️ Pré-calculando dados dos gráficos...")
+        outputs["charts"] = build_chart_payload(scores_df, clusters_df)
+
+    print("▶️ Gravando artefatos...")
+    write_artifacts(
+        {name: (df, getattr(artifacts, name)) for name, df in outputs.items()},
+        output_dir,
+        compression=compression,
+        jobs=jobs,
+    )
+
+    # History and reports only reflect runs whose artifacts were published: a
+    # failed write must not leave partitions or pages the manifest never described.
+    if "history" in stages:
+        if clean_df is None:
+            clean_df = read_artifact(output_dir, "cleaned", "clean", parse_dates=["Data"])
+        if scores_df is None:
+            scores_df = read_artifact(output_dir, "scores", "score", parse_dates=["Data"])
+
+        run_term = term or infer_term(clean_df)
+        print(f"▶️ Atualizando histórico (período {run_term})...")
+        for dataset, df in zip(HISTORY_DATASETS, (clean_df, scores_df)):
+            append_history(output_dir / HISTORY_DIR_NAME, dataset, df, run_term)
+        mark_history_updated(output_dir / HISTORY_DIR_NAME, run_term)
+
+    if "report" in stages:
+        from report import write_unit_reports
+
+        if scores_df is None:
+            scores_df = read_artifact(output_dir, "scores", "score", parse_dates=["Data"])
+        if clusters_df is None:
+            clusters_df = read_artifact(output_dir, "clusters", "cluster")
+        if profile_df is None:
+            profile_df = read_artifact(output_dir, "cluster_profiles", "cluster")
+        if rankings_df is None:
+            rankings_df = read_artifact(output_dir, "rankings", "cluster")
+
+        print("▶️ Gerando relatórios estáticos por unidade...")
+        rendered = write_unit_reports(scores_df, clusters_df, profile_df, rankings_df, output_dir / REPORTS_DIR_NAME)
+        print(f"   {len(rendered)} relatório(s) atualizado(s)")
 
     print("✅ Pipeline concluído")
-    return PipelineArtifacts(clean_path, scores_path, clusters_path, profiles_path)
+    return PipelineArtifacts.from_manifest(output_dir)
+
+
+def parse_stages(value: str) -> Tuple[str, ...]:
+    requested = {stage.strip() for stage in value.split(",") if stage.strip()}
+    unknown = requested - set(STAGES)
+    if unknown or not requested:
+        raise argparse.ArgumentTypeError(
+            f"etapas inválidas: {value!r} (opções: {','.join(STAGES)})"
+        )
+    # Keep the canonical order regardless of how the stages were typed.
+    return tuple(stage for stage in STAGES if stage in requested)
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"valor deve ser >= 1: {value}")
+    return number
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Pipeline de engajamento dos alunos (reshape → limpeza → scores → clustering)."
+    )
+    parser.add_argument("--input", type=Path, default=RAW_WORKBOOK, help="Workbook Excel de origem.")
+    parser.add_argument("--output-dir", type=Path, default=BASE_DIR, help="Diretório onde os CSVs são gravados.")
+    parser.add_argument(
+        "--stages",
+        type=parse_stages,
+        default=DEFAULT_STAGES,
+        help=f"Etapas separadas por vírgula (padrão: {','.join(DEFAULT_STAGES)}; opcional: report). "
+        "Etapas puladas reutilizam os CSVs já existentes em --output-dir.",
+    )
+    parser.add_argument("--n-clusters", type=positive_int, default=4, help="Número máximo de clusters do KMeans.")
+    parser.add_argument("--jobs", type=positive_int, default=None, help="Limite de threads usadas pelas etapas paralelas.")
+    parser.add_argument(
+        "--compression",
+        choices=["none", "gzip", "zstd"],
+        default="none",
+        help="Compressão dos CSVs gravados (zstd requer o pacote zstandard).",
+    )
+    parser.add_argument(
+        "--term",
+        default=None,
+        help="Período gravado no histórico (ex.: 2025-1). Padrão: inferido pela primeira data de aula.",
+    )
+    parser.add_argument(
+        "--diff-threshold",
+        type=float,
+        default=DIFF_THRESHOLD,
+        help="Variação mínima de engajamento por aula reportada pela etapa diff.",
+    )
+    parser.add_argument(
+        "--previous-dir",
+        type=Path,
+        default=None,
+        help="Diretório da execução anterior para a etapa diff (padrão: --output-dir antes da regravação).",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    args = parse_args(argv)
+    run_pipeline(
+        raw_path=args.input,
+        output_dir=args.output_dir,
+        stages=args.stages,
+        n_clusters=args.n_clusters,
+        jobs=args.jobs,
+        compression=None if args.compression == "none" else args.compression,
+        term=args.term,
+        diff_threshold=args.diff_threshold,
+        previous_dir=args.previous_dir,
+    )
 
 
 if __name__ == "__main__":
-    run_pipeline()
+    main()
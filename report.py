@@ -0,0 +1,293 @@
+"""Static per-Unidade HTML reports rendered from the pipeline outputs.
+
+Each report is a single self-contained HTML file (inline CSS and SVG, no
+scripts or external assets) with the overview most stakeholders look for in
+the dashboard: metric cards, the per-aula trend, the Sala×Aula heatmap, the
+cluster profile table and the unit's top/bottom students. The aggregations are
+the ones `streamlit_app.py` uses, imported from `pipeline.py`.
+
+Reports are only rendered for units whose inputs changed since the previous
+render, tracked by fingerprints in ``index.json``. Rendering one unit takes a
+few tens of milliseconds and holds the GIL, so units are rendered serially.
+"""
+from __future__ import annotations
+
+import hashlib
+import html
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import pandas as pd
+
+from pipeline import atomic_write, cluster_counts, engagement_by_aula, engagement_heatmap
+
+REPORT_VERSION = 1
+INDEX_NAME = "index.json"
+PROFILE_LABELS = {
+    "prep_score": "Preparação",
+    "attendance_score": "Presença",
+    "homework_score": "Lição",
+    "interaction_score": "Interação",
+    "engajamento": "Engajamento",
+}
+# Columns each report actually reads; profiles are fingerprinted whole.
+# Extend these when render_unit_report starts using another column.
+FINGERPRINT_COLUMNS = {
+    "scores": ["Sala", "Aula", "engajamento", "attendance_score", "prep_score", "interaction_score"],
+    "clusters": ["aluno_id", "cluster"],
+    "top": ["Aluno", "Sala", "engajamento"],
+    "bottom": ["Aluno", "Sala", "engajamento"],
+}
+SLUG_HASH_LENGTH = 6
+
+STYLE = """
+body { font-family: system-ui, sans-serif; margin: 2rem auto; max-width: 960px; color: #222; }
+h1 { margin-bottom: 0.2rem; }
+.meta { color: #666; margin-bottom: 1.5rem; }
+.cards { display: grid; grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); gap: 0.8rem; }
+.card { border: 1px solid #ddd; border-radius: 8px; padding: 0.8rem; }
+.card .label { color: #666; font-size: 0.85rem; }
+.card .value { font-size: 1.6rem; font-weight: 600; }
+table { border-collapse: collapse; margin: 0.5rem 0 1.5rem; font-size: 0.9rem; }
+th, td { border: 1px solid #ddd; padding: 0.3rem 0.6rem; text-align: right; }
+th:first-child, td:first-child { text-align: left; }
+.heatmap td { min-width: 2.2rem; text-align: center; }
+.lists { display: grid; grid-template-columns: 1fr 1fr; gap: 1.5rem; }
+"""
+
+
+@dataclass(frozen=True)
+class UnitInputs:
+    unidade: str
+    scores: pd.DataFrame
+    clusters: pd.DataFrame
+    profiles: pd.DataFrame
+    top: pd.DataFrame
+    bottom: pd.DataFrame
+
+    def fingerprint(self) -> str:
+        # Only the rendered columns are hashed, value by value: the date column
+        # is left out, and object vs string columns hash alike, so the same
+        # data read back from disk does not count as a change.
+        digest = hashlib.sha256(f"v{REPORT_VERSION}:{self.unidade}".encode("utf-8"))
+        for name in ("scores", "clusters", "profiles", "top", "bottom"):
+            frame = getattr(self, name)
+            for column in FINGERPRINT_COLUMNS.get(name, frame.columns):
+                digest.update(f"{name}.{column}".encode("utf-8"))
+                digest.update(pd.util.hash_pandas_object(frame[column], index=False).to_numpy().tobytes())
+        return digest.hexdigest()
+
+
+def slugify(value: str) -> str:
+    ascii_text = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", ascii_text.lower()).strip("-") or "unidade"
+
+
+def report_filename(unidade: str) -> str:
+    """Readable slug plus a short hash of the name, so units that slugify alike never share a file."""
+    suffix = hashlib.sha256(unidade.encode("utf-8")).hexdigest()[:SLUG_HASH_LENGTH]
+    return f"{slugify(unidade)}-{suffix}.html"
+
+
+def heat_color(value: float, low: float, high: float) -> str:
+    """Red → yellow → green ramp, matching the dashboard's ``redyellowgreen`` scheme."""
+    ratio = 0.5 if high <= low else min(max((value - low) / (high - low), 0.0), 1.0)
+    stops = [(215, 48, 39), (255, 255, 191), (26, 152, 80)]
+    start, end = (stops[0], stops[1]) if ratio < 0.5 else (stops[1], stops[2])
+    local = ratio * 2 if ratio < 0.5 else (ratio - 0.5) * 2
+    red, green, blue = (round(a + (b - a) * local) for a, b in zip(start, end))
+    return f"rgb({red},{green},{blue})"
+
+
+def render_trend_svg(trend: pd.DataFrame, width: int = 640, height: int = 220) -> str:
+    if trend.empty:
+        return "<p>Sem dados.</p>"
+    pad = 32
+    aulas = trend["Aula"].tolist()
+    values = trend["engajamento"].tolist()
+    top = max(1.0, max(values))
+    span = max(len(aulas) - 1, 1)
+    xs = [pad + (width - 2 * pad) * i / span for i in range(len(aulas))]
+    ys = [height - pad - (height - 2 * pad) * value / top for value in values]
+    points = " ".join(f"{x:.1f},{y:.1f}" for x, y in zip(xs, ys))
+    markers = "".join(
+        f"<circle cx='{x:.1f}' cy='{y:.1f}' r='3'><title>Aula {aula}: {value:.2f}</title></circle>"
+        f"<text x='{x:.1f}' y='{height - pad + 16}' text-anchor='middle' font-size='11'>{aula}</text>"
+        for x, y, aula, value in zip(xs, ys, aulas, values)
+    )
+    return (
+        f"<svg xmlns='http://www.w3.org/2000/svg' width='{width}' height='{height}' role='img'>"
+        f"<line x1='{pad}' y1='{height - pad}' x2='{width - pad}' y2='{height - pad}' stroke='#999'/>"
+        f"<text x='4' y='{pad}' font-size='11'>{top:.1f}</text>"
+        f"<text x='4' y='{height - pad}' font-size='11'>0</text>"
+        f"<polyline fill='none' stroke='#1f77b4' stroke-width='2' points='{points}'/>"
+        f"<g fill='#1f77b4'>{markers}</g></svg>"
+    )
+
+
+def render_heatmap(heatmap: pd.DataFrame) -> str:
+    if heatmap.empty:
+        return "<p>Sem dados.</p>"
+    grid = heatmap.pivot(index="Sala", columns="Aula", values="engajamento")
+    low, high = heatmap["engajamento"].min(), heatmap["engajamento"].max()
+    header = "".join(f"<th>{aula}</th>" for aula in grid.columns)
+    rows = []
+    for sala, values in grid.iterrows():
+        cells = "".join(
+            "<td></td>" if pd.isna(value) else f"<td style='background:{heat_color(value, low, high)}'>{value:.2f}</td>"
+            for value in values
+        )
+        rows.append(f"<tr><td>{html.escape(str(sala))}</td>{cells}</tr>")
+    return f"<table class='heatmap'><tr><th>Sala \\ Aula</th>{header}</tr>{''.join(rows)}</table>"
+
+
+def render_table(df: pd.DataFrame, float_format: str = "{:.2f}") -> str:
+    header = "".join(f"<th>{html.escape(str(column))}</th>" for column in df.columns)
+    rows = []
+    for record in df.itertuples(index=False):
+        cells = "".join(
+            f"<td>{float_format.format(value)}</td>" if isinstance(value, float) else f"<td>{html.escape(str(value))}</td>"
+            for value in record
+        )
+        rows.append(f"<tr>{cells}</tr>")
+    return f"<table><tr>{header}</tr>{''.join(rows)}</table>"
+
+
+def render_unit_report(inputs: UnitInputs, generated_at: str) -> str:
+    scores = inputs.scores
+    cards = [
+        ("Registros", f"{len(scores):,}"),
+        ("Alunos únicos", f"{inputs.clusters['aluno_id'].nunique():,}"),
+        ("Engajamento médio", f"{scores['engajamento'].mean():.2f}"),
+        ("Presença média", f"{scores['attendance_score'].mean():.2f}"),
+        ("Preparação média", f"{scores['prep_score'].mean():.2f}"),
+        ("Interação média", f"{scores['interaction_score'].mean():.2f}"),
+    ]
+    cards_html = "".join(
+        f"<div class='card'><div class='label'>{label}</div><div class='value'>{value}</div></div>"
+        for label, value in cards
+    )
+    counts = cluster_counts(inputs.clusters).rename(columns={"cluster": "Cluster", "alunos": "Alunos na unidade"})
+    profiles = inputs.profiles.rename(columns={"cluster": "Cluster", **PROFILE_LABELS}).merge(
+        counts, on="Cluster", how="left"
+    )
+    profiles["Alunos na unidade"] = profiles["Alunos na unidade"].fillna(0).astype(int)
+    ranking_columns = {"Aluno": "Aluno", "Sala": "Sala", "engajamento": "Engajamento"}
+    title = html.escape(inputs.unidade)
+
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head>
+<meta charset="utf-8">
+<title>Engajamento · {title}</title>
+<style>{STYLE}</style>
+</head>
+<body>
+<h1>📊 Engajamento · {title}</h1>
+<p class="meta">Gerado por <code>pipeline.py</code> em {generated_at}.</p>
+<div class="cards">{cards_html}</div>
+<h2>Evolução média por aula</h2>
+{render_trend_svg(engagement_by_aula(scores))}
+<h2>Engajamento médio por sala e aula</h2>
+{render_heatmap(engagement_heatmap(scores, by="Sala"))}
+<h2>Perfis médios por cluster</h2>
+{render_table(profiles)}
+<div class="lists">
+<div><h2>Top 10 alunos</h2>{render_table(inputs.top[list(ranking_columns)].rename(columns=ranking_columns))}</div>
+<div><h2>10 alunos com menor engajamento</h2>{render_table(inputs.bottom[list(ranking_columns)].rename(columns=ranking_columns))}</div>
+</div>
+</body>
+</html>
+"""
+
+
+def render_index(entries: Dict[str, Dict[str, str]], generated_at: str) -> str:
+    links = "".join(
+        f"<li><a href='{html.escape(entry['file'])}'>{html.escape(unidade)}</a></li>"
+        for unidade, entry in sorted(entries.items())
+    )
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head><meta charset="utf-8"><title>Relatórios por unidade</title><style>{STYLE}</style></head>
+<body>
+<h1>Relatórios por unidade</h1>
+<p class="meta">Atualizado em {generated_at}.</p>
+<ul>{links}</ul>
+</body>
+</html>
+"""
+
+
+def split_by_unit(
+    scores: pd.DataFrame, clusters: pd.DataFrame, profiles: pd.DataFrame, rankings: pd.DataFrame
+) -> List[UnitInputs]:
+    unit_rankings = rankings[rankings["escopo"] == "unidade"]
+    clusters_by_unit = dict(tuple(clusters.groupby("Unidade", sort=False)))
+    inputs = []
+    for unidade, unit_scores in scores.groupby("Unidade", sort=True):
+        ranked = unit_rankings[unit_rankings["chave"].astype(str) == str(unidade)].sort_values("posicao")
+        inputs.append(
+            UnitInputs(
+                unidade=str(unidade),
+                scores=unit_scores,
+                clusters=clusters_by_unit.get(unidade, clusters.iloc[:0]),
+                profiles=profiles,
+                top=ranked[ranked["ordem"] == "top"],
+                bottom=ranked[ranked["ordem"] == "bottom"],
+            )
+        )
+    return inputs
+
+
+def write_unit_reports(
+    scores: pd.DataFrame,
+    clusters: pd.DataFrame,
+    profiles: pd.DataFrame,
+    rankings: pd.DataFrame,
+    reports_dir: Path,
+) -> Sequence[str]:
+    """Render one HTML report per Unidade, skipping units whose inputs did not change.
+
+    Returns the units that were (re)rendered.
+    """
+    reports_dir.mkdir(parents=True, exist_ok=True)
+    index_path = reports_dir / INDEX_NAME
+    previous = json.loads(index_path.read_text(encoding="utf-8")) if index_path.exists() else {}
+    generated_at = datetime.now().isoformat(timespec="seconds")
+
+    entries: Dict[str, Dict[str, str]] = {}
+    stale: List[UnitInputs] = []
+    for unit in split_by_unit(scores, clusters, profiles, rankings):
+        entry = {"file": report_filename(unit.unidade), "fingerprint": unit.fingerprint()}
+        entries[unit.unidade] = entry
+        if previous.get(unit.unidade) != entry or not (reports_dir / entry["file"]).exists():
+            stale.append(unit)
+
+    for unit in stale:
+        document = render_unit_report(unit, generated_at)
+        atomic_write(
+            reports_dir / entries[unit.unidade]["file"],
+            lambda tmp: tmp.write_text(document, encoding="utf-8"),
+        )
+
+    # Reports of units that disappeared from the data (or were renamed) are
+    # removed with their index entry.
+    current_files = {entry["file"] for entry in entries.values()}
+    for entry in previous.values():
+        if entry["file"] not in current_files:
+            (reports_dir / entry["file"]).unlink(missing_ok=True)
+
+    atomic_write(
+        reports_dir / "index.html",
+        lambda tmp: tmp.write_text(render_index(entries, generated_at), encoding="utf-8"),
+    )
+    atomic_write(
+        index_path,
+        lambda tmp: tmp.write_text(json.dumps(entries, ensure_ascii=False, indent=2), encoding="utf-8"),
+    )
+    return [unit.unidade for unit in stale]
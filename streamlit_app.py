@@ -3,17 +3,42 @@ Interactive dashboard built with Streamlit to explore engagement outputs.
 
 The app assumes that `pipeline.py` has been executed and that the CSV artifacts
 are available in the repository root. Use this interface to filter by unidade,
-sala e cluster e visualizar métricas-chave sem abrir notebooks.
+sala e cluster e visualizar métricas-chave sem abrir notebooks. Artifacts are
+resolved through the manifest the pipeline publishes last, so a run in progress
+is never half-read.
+
+The loaded dataset is shared read-only by every session of the server process
+(`st.cache_resource` over Arrow-backed frames); filters select row positions
+and only materialise the columns and rows a widget actually displays.
 """
 
 from __future__ import annotations
 
+from dataclasses import dataclass
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from pipeline import (
+    HISTORY_DIR_NAME,
+    HISTORY_MARKER,
+    MANIFEST_NAME,
+    build_chart_payload,
+    cluster_counts,
+    engagement_by_aula,
+    list_history_partitions,
+    load_manifest,
+    read_history,
+    read_verified_artifact,
+    read_verified_json,
+)
+
 DATA_DIR = Path(__file__).parent
+HISTORY_DIR = DATA_DIR / HISTORY_DIR_NAME
+REQUIRED_ARTIFACTS = ["scores", "clusters", "cluster_profiles", "rankings"]
+LOAD_RETRIES = 3
 
 CLUSTER_NOTES = {
     0: "Cluster 0 reúne os **super engajados**: presença e preparação quase constantes. "
@@ -25,22 +50,160 @@ CLUSTER_NOTES = {
     3: "Cluster 3 corresponde a um **nível intermediário**. Precisam de reforço em preparação e lição de casa para não regredirem.",
 }
 
-
-def load_csv(filename: str, parse_dates: list[str] | None = None) -> pd.DataFrame:
-    """Read a CSV from the repository root and fail fast if it is missing."""
-    path = DATA_DIR / filename
-    if not path.exists():
-        st.error(f"Arquivo `{filename}` não encontrado. Execute `python pipeline.py` antes de abrir o app.")
+RANKING_DISPLAY = ["aluno_id", "Aluno", "Sala", "Unidade", "engajamento"]
+RECORD_COLUMNS = [
+    "Data",
+    "Aluno",
+    "Sala",
+    "Unidade",
+    "Aula",
+    "prep_score",
+    "attendance_score",
+    "homework_score",
+    "interaction_score",
+    "engajamento",
+]
+PAGE_SIZES = [25, 50, 100, 200]
+ALL_SCOPE = "*"
+
+
+def manifest_signature() -> int:
+    """Fail fast if the pipeline never ran; otherwise key the cache on the manifest version."""
+    path = DATA_DIR / MANIFEST_NAME
+    manifest = load_manifest(DATA_DIR) if path.exists() else {"artifacts": {}}
+    missing = [name for name in REQUIRED_ARTIFACTS if name not in manifest["artifacts"]]
+    if missing:
+        st.error(
+            f"Artefatos ausentes no manifesto `{MANIFEST_NAME}`: {', '.join(missing)}. "
+            "Execute `python pipeline.py` antes de abrir o app."
+        )
         st.stop()
-    return pd.read_csv(path, parse_dates=parse_dates)
+    return path.stat().st_mtime_ns
+
+
+@dataclass(frozen=True)
+class SharedDataset:
+    """Process-wide artifact set; treat every frame as read-only."""
+
+    scores: pd.DataFrame
+    clusters: pd.DataFrame
+    profiles: pd.DataFrame
+    rankings: pd.DataFrame
+    records: pd.DataFrame
+    chart_series: dict[str, pd.DataFrame]
+    chart_specs: dict[str, dict]
+
+
+def read_arrow_artifact(entry: dict, **read_kwargs) -> pd.DataFrame:
+    return read_verified_artifact(DATA_DIR, entry, engine="pyarrow", dtype_backend="pyarrow", **read_kwargs)
+
+
+@st.cache_resource(max_entries=1)
+def load_data(signature: int) -> SharedDataset:
+    # cache_resource hands the same object to every session instead of unpickling a
+    # copy per rerun; max_entries=1 releases the previous run once the manifest changes.
+    artifacts = load_manifest(DATA_DIR)["artifacts"]
+    scores = read_arrow_artifact(artifacts["scores"], parse_dates=["Data"])
+    clusters = read_arrow_artifact(artifacts["clusters"])
+    # Sorted once per load so the paginated record sample only slices rows.
+    records = scores[RECORD_COLUMNS].sort_values(["Data", "Aluno"], kind="stable").reset_index(drop=True)
+    # Outputs from before the `charts` stage existed are aggregated once here instead.
+    if "charts" in artifacts:
+        charts = read_verified_json(DATA_DIR, artifacts["charts"])
+    else:
+        charts = build_chart_payload(scores, clusters)
+    return SharedDataset(
+        scores=scores,
+        clusters=clusters,
+        profiles=read_arrow_artifact(artifacts["cluster_profiles"]),
+        rankings=read_arrow_artifact(artifacts["rankings"], dtype={"chave": "string[pyarrow]"}),
+        records=records,
+        chart_series={name: pd.DataFrame(rows) for name, rows in charts["series"].items()},
+        chart_specs=charts["specs"],
+    )
+
+
+def load_consistent_data() -> SharedDataset:
+    """Load the artifact set published by the current manifest.
+
+    A run in progress never touches the published files, but it prunes them
+    right after replacing the manifest; re-reading the manifest picks up the
+    new set, so retries need no delay.
+    """
+    for _ in range(LOAD_RETRIES):
+        try:
+            return load_data(manifest_signature())
+        except (ValueError, FileNotFoundError):
+            continue
+    st.error("Os artefatos não conferem com o manifesto (pipeline em execução?). Recarregue a página em instantes.")
+    st.stop()
+
+
+def history_signature() -> int:
+    """Key the history caches on the marker the pipeline writes after the last partition."""
+    marker = HISTORY_DIR / HISTORY_MARKER
+    return marker.stat().st_mtime_ns if marker.exists() else 0
 
 
 @st.cache_data
-def load_data() -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
-    scores = load_csv("engagement_scores.csv", parse_dates=["Data"])
-    clusters = load_csv("student_clusters.csv")
-    profiles = load_csv("cluster_profiles.csv")
-    return scores, clusters, profiles
+def load_history_partitions(signature: int) -> pd.DataFrame:
+    return list_history_partitions(HISTORY_DIR)
+
+
+@st.cache_data
+def load_history_trend(
+    signature: int, terms: tuple[str, ...], unidades: tuple[str, ...], salas: tuple[str, ...]
+) -> pd.DataFrame:
+    """Mean engajamento per Aula and term, reading only the needed partitions and columns."""
+    history = read_history(
+        HISTORY_DIR,
+        columns=["term", "Aula", "engajamento"],
+        terms=terms,
+        unidades=unidades,
+        salas=salas,
+    )
+    return history.pivot_table(index="Aula", columns="term", values="engajamento", aggfunc="mean")
+
+
+def filter_positions(df: pd.DataFrame, unidades: list[str], salas: list[str]) -> np.ndarray:
+    """Row positions matching the unidade/sala filters; an empty selection keeps every row."""
+    mask = np.ones(len(df), dtype=bool)
+    if unidades:
+        mask &= df["Unidade"].isin(unidades).to_numpy(dtype=bool)
+    if salas:
+        mask &= df["Sala"].isin(salas).to_numpy(dtype=bool)
+    return np.flatnonzero(mask)
+
+
+def select_rows(df: pd.DataFrame, positions: np.ndarray, columns: list[str] | None = None) -> pd.DataFrame:
+    """Materialise only ``columns`` for ``positions`` from a shared frame."""
+    return (df if columns is None else df[columns]).take(positions)
+
+
+def ranking_slice(rankings: pd.DataFrame, escopo: str, chave, ordem: str) -> pd.DataFrame:
+    """Return a precomputed ranking produced by `pipeline.build_rankings`."""
+    selected = rankings[
+        (rankings["escopo"] == escopo) & (rankings["chave"] == str(chave)) & (rankings["ordem"] == ordem)
+    ]
+    return selected.sort_values("posicao")[RANKING_DISPLAY].reset_index(drop=True)
+
+
+def precomputed_scope(
+    selected_unidades: list[str], selected_salas: list[str], unidades: list[str], salas: list[str]
+) -> str | None:
+    """Map the filters to a precomputed slice: ALL_SCOPE, a single unidade, or None."""
+    if selected_salas and set(selected_salas) != set(salas):
+        return None
+    if not selected_unidades or set(selected_unidades) == set(unidades):
+        return ALL_SCOPE
+    if len(selected_unidades) == 1:
+        return selected_unidades[0]
+    return None
+
+
+def paginate(positions: np.ndarray, page: int, page_size: int) -> np.ndarray:
+    start = (page - 1) * page_size
+    return positions[start : start + page_size]
 
 
 def format_pct(value: float) -> str:
@@ -55,7 +218,14 @@ def main() -> None:
         "via `pipeline.py`. Rode o pipeline sempre que um novo Excel for importado."
     )
 
-    scores_df, clusters_df, profiles_df = load_data()
+    dataset = load_consistent_data()
+    scores_df, clusters_df, profiles_df, rankings_df, records_df = (
+        dataset.scores,
+        dataset.clusters,
+        dataset.profiles,
+        dataset.rankings,
+        dataset.records,
+    )
     query_params = st.query_params
     show_hidden = query_params.get("briefing", [""])[0].lower() == "grupo"
 
@@ -183,13 +353,11 @@ Perfis típicos:
             "Quedas acentuadas sinalizam momentos em que a equipe pedagógica pode reforçar comunicação ou atividades complementares.</div>",
             unsafe_allow_html=True,
         )
-        overall_engagement = (
-            scores_df.groupby("Aula")["engajamento"]
-            .mean()
-            .reset_index()
-            .sort_values("Aula")
+        st.vega_lite_chart(
+            dataset.chart_series["engagement_by_aula"],
+            dataset.chart_specs["engagement_by_aula"],
+            use_container_width=True,
         )
-        st.line_chart(overall_engagement.set_index("Aula"))
 
         st.markdown("<div style='margin:28px 0;'></div>", unsafe_allow_html=True)
         st.markdown(
@@ -197,29 +365,9 @@ Perfis típicos:
             "Regiões em vermelho indicam necessidade de intervenção; verdes apontam salas com ótimo aproveitamento.</div>",
             unsafe_allow_html=True,
         )
-        import altair as alt
-
-        heatmap_df = (
-            scores_df.groupby(["Unidade", "Aula"])["engajamento"]
-            .mean()
-            .reset_index()
-        )
-        heatmap_chart = (
-            alt.Chart(heatmap_df)
-            .mark_rect()
-            .encode(
-                x=alt.X("Aula:O", title="Aula"),
-                y=alt.Y("Unidade:N", sort="ascending"),
-                color=alt.Color("engajamento:Q", scale=alt.Scale(scheme="redyellowgreen"), title="Engajamento"),
-                tooltip=[
-                    alt.Tooltip("Unidade:N"),
-                    alt.Tooltip("Aula:O"),
-                    alt.Tooltip("engajamento:Q", format=".2f"),
-                ],
-            )
-            .properties(height=300)
+        st.vega_lite_chart(
+            dataset.chart_series["heatmap"], dataset.chart_specs["heatmap"], use_container_width=True
         )
-        st.altair_chart(heatmap_chart, use_container_width=True)
 
         st.markdown("<div style='margin:28px 0;'></div>", unsafe_allow_html=True)
         st.markdown(
@@ -228,8 +376,9 @@ Perfis típicos:
             "Essa segmentação direciona ações como mentorias individuais ou reforços positivos.</div>",
             unsafe_allow_html=True,
         )
-        cluster_counts = clusters_df["cluster"].value_counts().sort_index()
-        st.bar_chart(cluster_counts)
+        st.vega_lite_chart(
+            dataset.chart_series["cluster_counts"], dataset.chart_specs["cluster_counts"], use_container_width=True
+        )
 
         st.markdown("<div style='margin:28px 0;'></div>", unsafe_allow_html=True)
         st.markdown(
@@ -273,22 +422,22 @@ Use este roteiro somente ao acessar o app com `?briefing=grupo`.
         selected_unidades = st.multiselect("Unidades", unidades, default=unidades)
 
         if selected_unidades:
-            salas = sorted(
-                scores_df[scores_df["Unidade"].isin(selected_unidades)]["Sala"].dropna().unique()
-            )
+            salas = sorted(scores_df.loc[scores_df["Unidade"].isin(selected_unidades), "Sala"].dropna().unique())
         else:
             salas = sorted(scores_df["Sala"].dropna().unique())
 
         selected_salas = st.multiselect("Salas", salas, default=salas)
 
-        filtered_scores = scores_df[
-            ((scores_df["Unidade"].isin(selected_unidades)) | (not selected_unidades))
-            & ((scores_df["Sala"].isin(selected_salas)) | (not selected_salas))
-        ]
-        filtered_clusters = clusters_df[
-            ((clusters_df["Unidade"].isin(selected_unidades)) | (not selected_unidades))
-            & ((clusters_df["Sala"].isin(selected_salas)) | (not selected_salas))
-        ]
+        score_positions = filter_positions(scores_df, selected_unidades, selected_salas)
+        filtered_scores = select_rows(
+            scores_df,
+            score_positions,
+            ["Aula", "engajamento", "attendance_score", "prep_score", "interaction_score"],
+        )
+        # Only what the cluster counts and the top-10 table read.
+        filtered_clusters = select_rows(
+            clusters_df, filter_positions(clusters_df, selected_unidades, selected_salas), ["cluster", *RANKING_DISPLAY]
+        )
 
         if filtered_scores.empty:
             st.warning("Nenhum registro encontrado para os filtros selecionados.")
@@ -300,21 +449,49 @@ Use este roteiro somente ao acessar o app com `?briefing=grupo`.
         col3.metric("Preparação média", f"{filtered_scores['prep_score'].mean():.2f}")
         col4.metric("Interação média", f"{filtered_scores['interaction_score'].mean():.2f}")
 
+        # Whole-network and whole-unit filters come from the pipeline chart bundle;
+        # any other combination is aggregated live from the filtered rows.
+        scope = precomputed_scope(selected_unidades, selected_salas, unidades, salas)
+        heatmap = dataset.chart_series["heatmap"]
+        breakdown = dataset.chart_series["cluster_unit_breakdown"]
+        if scope == ALL_SCOPE:
+            aula_trend = dataset.chart_series["engagement_by_aula"]
+            scope_counts = dataset.chart_series["cluster_counts"]
+        elif scope is not None:
+            aula_trend = heatmap.loc[heatmap["Unidade"] == scope, ["Aula", "engajamento"]]
+            scope_counts = breakdown.loc[breakdown["Unidade"] == scope, ["cluster", "alunos"]]
+        else:
+            aula_trend = engagement_by_aula(filtered_scores)
+            scope_counts = cluster_counts(filtered_clusters)
+
         st.subheader("Evolução média por aula")
-        engagement_by_aula = (
-            filtered_scores.groupby("Aula")["engajamento"]
-            .mean()
-            .reset_index()
-            .sort_values("Aula")
-        )
-        st.line_chart(engagement_by_aula.set_index("Aula"))
+        st.line_chart(aula_trend.set_index("Aula"))
+
+        st.subheader("Comparação entre períodos")
+        signature = history_signature()
+        try:
+            partitions = load_history_partitions(signature)
+            terms = sorted(partitions["term"].unique())
+            selected_terms = st.multiselect("Períodos", terms, default=terms[-1:]) if terms else []
+            history_trend = (
+                load_history_trend(signature, tuple(selected_terms), tuple(selected_unidades), tuple(selected_salas))
+                if selected_terms
+                else None
+            )
+        except (OSError, ValueError):
+            # A term directory swapped out mid-scan; nothing is cached, the next rerun reads the new one.
+            st.warning("O histórico está sendo atualizado pelo pipeline. Recarregue a página em instantes.")
+        else:
+            if partitions.empty:
+                st.info("Histórico vazio. Rode `python pipeline.py` (etapa `history`) para acumular períodos.")
+            elif history_trend is not None:
+                st.line_chart(history_trend)
 
         st.subheader("Distribuição de clusters (alunos únicos)")
         if filtered_clusters.empty:
             st.info("Sem dados agregados para cluster no filtro atual.")
         else:
-            counts = filtered_clusters["cluster"].value_counts().sort_index()
-            st.bar_chart(counts)
+            st.bar_chart(scope_counts.set_index("cluster")["alunos"])
 
         st.subheader("Perfis médios por cluster")
         st.dataframe(
@@ -331,33 +508,25 @@ Use este roteiro somente ao acessar o app com `?briefing=grupo`.
         )
 
         st.subheader("Top 10 alunos por engajamento (filtro atual)")
-        top_students = (
-            filtered_scores.groupby(["aluno_id", "Aluno", "Sala", "Unidade"])["engajamento"]
-            .mean()
-            .reset_index()
-            .sort_values("engajamento", ascending=False)
-            .head(10)
-        )
+        # Student means per (aluno_id, Sala, Unidade) are already in student_clusters.csv;
+        # a whole unidade maps to its precomputed ranking, other filters use partial selection.
+        if scope not in (None, ALL_SCOPE):
+            top_students = ranking_slice(rankings_df, "unidade", scope, "top")
+        else:
+            top_students = filtered_clusters.nlargest(10, "engajamento")[RANKING_DISPLAY]
         st.dataframe(top_students.style.format({"engajamento": "{:.2f}"}), use_container_width=True)
 
         st.subheader("Amostra de registros por aula")
+        record_positions = filter_positions(records_df, selected_unidades, selected_salas)
+        page_cols = st.columns([1, 1, 2])
+        page_size = page_cols[0].selectbox("Registros por página", PAGE_SIZES, index=1)
+        total_pages = max(1, -(-len(record_positions) // page_size))
+        page = int(
+            page_cols[1].number_input("Página", min_value=1, max_value=total_pages, value=1, step=1)
+        )
+        page_cols[2].caption(f"Página {page} de {total_pages} · {len(record_positions):,} registros no filtro")
         st.dataframe(
-            filtered_scores[
-                [
-                    "Data",
-                    "Aluno",
-                    "Sala",
-                    "Unidade",
-                    "Aula",
-                    "prep_score",
-                    "attendance_score",
-                    "homework_score",
-                    "interaction_score",
-                    "engajamento",
-                ]
-            ]
-            .sort_values(["Data", "Aluno"])
-            .head(50)
+            select_rows(records_df, paginate(record_positions, page, page_size)), use_container_width=True
         )
 
     with tab_clusters:
@@ -382,33 +551,27 @@ Use este roteiro somente ao acessar o app com `?briefing=grupo`.
         metric_cols[3].metric("Interação média", f"{cluster_profile['interaction_score']:.2f}")
         metric_cols[4].metric("Engajamento", f"{cluster_profile['engajamento']:.2f}")
 
-        cluster_members = clusters_df[clusters_df["cluster"] == selected_cluster]
+        cluster_size = int((clusters_df["cluster"] == selected_cluster).sum())
         st.markdown(
-            f"<div style='font-size:18px;'>Total de alunos no cluster: <strong>{len(cluster_members):,}</strong></div>",
+            f"<div style='font-size:18px;'>Total de alunos no cluster: <strong>{cluster_size:,}</strong></div>",
             unsafe_allow_html=True,
         )
 
+        breakdown = dataset.chart_series["cluster_unit_breakdown"]
         unidade_breakdown = (
-            cluster_members.groupby("Unidade")["aluno_id"]
-            .nunique()
+            breakdown[breakdown["cluster"] == selected_cluster]
+            .set_index("Unidade")["alunos"]
             .sort_values(ascending=False)
         )
         st.markdown("<div style='font-size:18px;'>Distribuição por unidade:</div>", unsafe_allow_html=True)
         st.bar_chart(unidade_breakdown)
 
-        subset_scores = scores_df[scores_df["aluno_id"].isin(cluster_members["aluno_id"])]
-        student_avg = (
-            subset_scores.groupby(["aluno_id", "Aluno", "Sala", "Unidade"])["engajamento"]
-            .mean()
-            .reset_index()
-        )
-
         st.markdown("<div style='font-size:18px;'>Top 10 alunos no cluster:</div>", unsafe_allow_html=True)
-        top_cluster = student_avg.sort_values("engajamento", ascending=False).head(10)
+        top_cluster = ranking_slice(rankings_df, "cluster", selected_cluster, "top")
         st.dataframe(top_cluster.style.format({"engajamento": "{:.2f}"}), use_container_width=True)
 
         st.markdown("<div style='font-size:18px;'>10 alunos com menor engajamento dentro do cluster:</div>", unsafe_allow_html=True)
-        bottom_cluster = student_avg.sort_values("engajamento", ascending=True).head(10)
+        bottom_cluster = ranking_slice(rankings_df, "cluster", selected_cluster, "bottom")
         st.dataframe(bottom_cluster.style.format({"engajamento": "{:.2f}"}), use_container_width=True)
 
         st.markdown(